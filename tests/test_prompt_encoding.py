@@ -0,0 +1,87 @@
+"""Pre-tokenized prompt pieces must encode to the same ids as the fully rendered chat prompt"""
+import os
+from string import Formatter
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import PreTrainedTokenizerFast
+
+import main
+
+SPECIAL_TOKENS = ["<|end_of_text|>", "<|start_of_role|>", "<|end_of_role|>"]
+CHAT_TEMPLATE = (
+    "{% for message in messages %}"
+    "<|start_of_role|>{{ message['role'] }}<|end_of_role|>{{ message['content'] }}<|end_of_text|>\n"
+    "{% endfor %}"
+    "{% if add_generation_prompt %}<|start_of_role|>assistant<|end_of_role|>{% endif %}"
+)
+TEMPLATES = [
+    main.COMPOSER_PROMPT_TEMPLATE,
+    main.PROFILE_PROMPT_TEMPLATE,
+    main.OPTIMIZATION_PROMPT_TEMPLATE,
+    main.CULTURAL_PROMPT_TEMPLATE,
+    main.ANALYSIS_PROMPT_TEMPLATE,
+]
+SLOT_VALUES = ["", "18", "Casual chat with friends", "  padded value  ", "line one\n\nline two\n", "Hey!!"]
+CONTEXTS = ["", "Age: 18, Culture: Indian", " leading space"]
+
+class NoModelBatcher(main.GenerationBatcher):
+    """Batcher with only the tokenization side, for encoding checks without a model"""
+    
+    def _prefill_system_prefix(self):
+        return None
+
+@pytest.fixture(scope="module")
+def tokenizer():
+    # A small byte-level BPE stands in for Granite's, which the test cannot download
+    backend = Tokenizer(models.BPE())
+    backend.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    backend.decoder = decoders.ByteLevel()
+    # Whitespace runs are included so merged newline and space tokens exist, as in Granite's vocabulary
+    corpus = [main.SYSTEM_PROMPT_TEMPLATE, *TEMPLATES, *SLOT_VALUES, *CONTEXTS, "\n\n", "\n\n\n", "    "] * 20
+    backend.train_from_iterator(corpus, trainers.BpeTrainer(
+        vocab_size=2000,
+        special_tokens=SPECIAL_TOKENS,
+        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()
+    ))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, eos_token="<|end_of_text|>")
+    tokenizer.chat_template = CHAT_TEMPLATE
+    return tokenizer
+
+@pytest.fixture(scope="module")
+def batcher(tokenizer):
+    return NoModelBatcher(tokenizer, None, torch.device("cpu"))
+
+def rendered_ids(tokenizer, prompt, demographic_context):
+    rendered = tokenizer.apply_chat_template(
+        [
+            {"role": "system", "content": main.SYSTEM_PROMPT_TEMPLATE.format(demographic_context=demographic_context)},
+            {"role": "user", "content": prompt}
+        ],
+        add_generation_prompt=True,
+        tokenize=False
+    )
+    return tokenizer(rendered, add_special_tokens=False)["input_ids"]
+
+@pytest.mark.parametrize("demographic_context", CONTEXTS)
+def test_plain_prompt_matches_rendering(tokenizer, batcher, demographic_context):
+    prompt = "Please rewrite this:  hello there\n"
+    assert batcher.prefix_ids + batcher.encode_prompt(prompt, demographic_context) == (
+        rendered_ids(tokenizer, prompt, demographic_context)
+    )
+
+@pytest.mark.parametrize("template", TEMPLATES)
+@pytest.mark.parametrize("value", SLOT_VALUES)
+def test_template_matches_rendering(tokenizer, batcher, template, value):
+    slots = [field for _, field, _, _ in Formatter().parse(template) if field is not None]
+    # Every slot set to the value, and only the first slot set with the rest left empty
+    for prompt_slots in (dict.fromkeys(slots, value), {slot: value if i == 0 else "" for i, slot in enumerate(slots)}):
+        assert batcher.prefix_ids + batcher.encode_prompt(template, CONTEXTS[1], prompt_slots) == (
+            rendered_ids(tokenizer, template.format(**prompt_slots), CONTEXTS[1])
+        )
@@ -0,0 +1,26 @@
+# cython: language_level=3str, boundscheck=False, wraparound=False
+"""Single-pass word, sentence and character counts for the Tone Analyzer metrics"""
+
+def text_metrics(unicode s):
+    """Return (word_count, sentence_count, char_count) for s in one scan
+
+    Words are runs of non-whitespace; a sentence is a non-blank run of text between
+    '.', '!' or '?' terminators. Matches the WORD_RE/SENTENCE_RE fallback in main.py.
+    """
+    cdef Py_ssize_t n = len(s), words = 0, sentences = 0, i
+    cdef Py_UCS4 c
+    cdef bint in_word = False, in_sentence = False
+    for i in range(n):
+        c = s[i]
+        if c.isspace():
+            in_word = False
+            continue
+        if not in_word:
+            words += 1
+            in_word = True
+        if c == u'.' or c == u'!' or c == u'?':
+            in_sentence = False
+        elif not in_sentence:
+            sentences += 1
+            in_sentence = True
+    return words, sentences, n